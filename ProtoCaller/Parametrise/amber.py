@@ -1,15 +1,28 @@
-import glob as _glob
+import asyncio as _asyncio
+import collections as _collections
+import concurrent.futures as _futures
+import functools as _functools
+import hashlib as _hashlib
 import os as _os
+import shutil as _shutil
+import tempfile as _tempfile
 import warnings as _warnings
 
 import ProtoCaller as _PC
+import ProtoCaller.Utils.fileio as _fileio
 import ProtoCaller.Wrappers.babelwrapper as _babel
 import ProtoCaller.Wrappers.parmedwrapper as _pmd
 import ProtoCaller.Wrappers.rdkitwrapper as _rdkit
 import ProtoCaller.Utils.runexternal as _runexternal
 import ProtoCaller.Utils.stdio as _stdio
 
-__all__ = ["amberWrapper", "runAntechamber", "runParmchk", "runTleap"]
+__all__ = ["amberWrapper", "amberWrapperAsync", "amberWrapperBatch", "amberWrapperGather", "amberWrapperGatherAsync",
+           "runAntechamber", "runAntechamberAsync", "runParmchk", "runParmchkAsync", "runTleap", "runTleapAsync"]
+
+# later updates take precedence, e.g. ff99SB is both an old and a protein force field
+_FF_PATHS = {name: "leaprc.water.%s" % name for name in _PC.AMBERWATERFFS}
+_FF_PATHS.update({name: "leaprc.protein.%s" % name for name in _PC.AMBERPROTEINFFS})
+_FF_PATHS.update({name: "oldff/leaprc." + name for name in _PC.AMBEROLDFFS})
 
 
 def amberWrapper(params, filename, molecule_type, id=None, charge=None, *args, **kwargs):
@@ -41,6 +54,24 @@ def amberWrapper(params, filename, molecule_type, id=None, charge=None, *args, *
         the second one - the coordinate file.
     """
     if id is None: id = molecule_type
+    inputs = _amberInputs(params, filename, molecule_type, id)
+    if inputs is None:
+        return
+    force_fields, files, param_files = inputs
+
+    if molecule_type == "ligand":
+        files = [runAntechamber(params.ligand_ff, filename, charge=charge)]
+        param_files = [runParmchk(params.ligand_ff, files[0])]
+
+    parametrised_files = runTleap(force_fields=force_fields, files=files, param_files=param_files, id=id, *args,
+                                  **kwargs)
+    if molecule_type == "cofactor":
+        parametrised_files = _alignCofactor(filename, parametrised_files, id)
+
+    return parametrised_files
+
+
+def _amberInputs(params, filename, molecule_type, id):
     force_fields, files, param_files = [], [filename], []
 
     if molecule_type == "protein":
@@ -60,51 +91,247 @@ def amberWrapper(params, filename, molecule_type, id=None, charge=None, *args, *
                            "water model. Be careful when using these "
                            "parameters with %s/%s" % (params.protein_ff,
                                                       params.water_ff.upper()))
+        # here we override the default parametrisation behaviour for cofactors
         files = []
         force_fields = [params.protein_ff, params.ligand_ff]
-        param_files = _glob.glob("%s/shared/amber-parameters/cofactors/%s.*" % (_PC.HOMEDIR, id))
-
-        # here we override the default parametrisation behaviour for cofactors
-        parametrised_files =  runTleap(force_fields=force_fields, files=files,
-                                       param_files=param_files, id=id, *args,
-                                       **kwargs)
-        filebase = _os.path.splitext(filename)[0]
-        topol = "{}.prmtop".format(filebase)
-        _os.rename(parametrised_files[0], topol)
-        parametrised_files[0] = topol
-
-        # convert the parametrised file into PDB and load in RDKit
-        ref = _rdkit.openAsRdkit(filename, removeHs=False)
-        mol = _pmd.openFilesAsParmed(parametrised_files)
-        pdb_file = _pmd.saveFilesFromParmed(mol, [filename], overwrite=True)[0]
-        mol = _rdkit.openAsRdkit(pdb_file, removeHs=False)
-
-        # align the parametrised file to the molecule and overwrite
-        # previous coordinates
-        mol, mcs = _stdio.stdout_stderr()(_rdkit.alignTwoMolecules) \
-            (ref, mol, two_way_matching=True,
-             mcs_parameters=dict(atomCompare="elements", keep_EZ=False, keep_stereo=False))
-        if min(mol.GetNumAtoms(), ref.GetNumAtoms()) != len(mcs):
-            _warnings.warn("The cofactor {} does not perfectly match the "
-                           "AMBER parameter file. Please check your "
-                           "molecule".format(id))
-        _os.remove(parametrised_files[1])
-        coord = "{}.inpcrd".format(filebase)
-        parametrised_files[1] = _rdkit.saveFromRdkit(mol, coord)
-        return parametrised_files
+        param_files = list(_cofactorFiles(id))
     elif molecule_type == "ligand":
         force_fields = [params.ligand_ff]
-        files = [runAntechamber(params.ligand_ff, filename, charge=charge)]
-        param_files = [runParmchk(params.ligand_ff, files[0])]
     else:
         raise ValueError("Value %s for molecule_type not supported " % molecule_type)
 
-    return runTleap(force_fields=force_fields, files=files, param_files=param_files, id=id, *args, **kwargs)
+    return force_fields, files, param_files
+
+
+@_functools.lru_cache(maxsize=None)
+def _cofactorFiles(id):
+    # the shipped cofactor parameters never change, so we only need to scan the directory once per cofactor
+    cofactor_dir = "%s/shared/amber-parameters/cofactors" % _PC.HOMEDIR
+    return tuple(sorted(entry.path for entry in _os.scandir(cofactor_dir) if entry.name.startswith(id + ".")))
+
+
+def _alignCofactor(filename, parametrised_files, id):
+    filebase = _os.path.splitext(filename)[0]
+    topol = "{}.prmtop".format(filebase)
+    _os.rename(parametrised_files[0], topol)
+    parametrised_files[0] = topol
+
+    # convert the parametrised file into PDB and load in RDKit
+    ref = _rdkit.openAsRdkit(filename, removeHs=False)
+    mol = _pmd.openFilesAsParmed(parametrised_files)
+    pdb_file = _pmd.saveFilesFromParmed(mol, [filename], overwrite=True)[0]
+    mol = _rdkit.openAsRdkit(pdb_file, removeHs=False)
+
+    # align the parametrised file to the molecule and overwrite
+    # previous coordinates
+    mol, mcs = _stdio.stdout_stderr()(_rdkit.alignTwoMolecules) \
+        (ref, mol, two_way_matching=True,
+         mcs_parameters=dict(atomCompare="elements", keep_EZ=False, keep_stereo=False))
+    if min(mol.GetNumAtoms(), ref.GetNumAtoms()) != len(mcs):
+        _warnings.warn("The cofactor {} does not perfectly match the "
+                       "AMBER parameter file. Please check your "
+                       "molecule".format(id))
+    _os.remove(parametrised_files[1])
+    coord = "{}.inpcrd".format(filebase)
+    parametrised_files[1] = _rdkit.saveFromRdkit(mol, coord)
+    return parametrised_files
+
+
+async def amberWrapperAsync(params, filename, molecule_type, id=None, charge=None, *args, nthreads=None, **kwargs):
+    """
+    An asynchronous version of amberWrapper. All external programs are awaited, so that many molecules can be
+    parametrised concurrently within the same event loop.
+
+    Parameters
+    ----------
+    params : ProtoCaller.Parametrise.Params
+        Force field parameters.
+    filename : str
+        Name of the input file.
+    molecule_type : str
+        The type of the molecule. One of: "protein", "ligand", "cofactor", "water", "simple_anion", "complex_anion",
+        "simple_cation", "complex_cation".
+    id : str
+        The name of the molecule. Default: equal to molecule_type.
+    charge : bool
+        The net charge of the molecule. Default: automatic detection by antechamber.
+    args
+        Positional arguments to be passed to the relevant wrapper.
+    nthreads : int
+        Number of OpenMP threads used by antechamber. Default: inherited from the environment.
+    kwargs
+        Keyword arguments to be passed to the relevant wrapper.
+
+    Returns
+    -------
+    files : [str]
+        The output parametrised file(s). If there is more than one file, the first one is always the topology file and
+        the second one - the coordinate file.
+    """
+    if id is None: id = molecule_type
+    inputs = _amberInputs(params, filename, molecule_type, id)
+    if inputs is None:
+        return
+    force_fields, files, param_files = inputs
+
+    if molecule_type == "ligand":
+        files = [await runAntechamberAsync(params.ligand_ff, filename, charge=charge, nthreads=nthreads)]
+        param_files = [await runParmchkAsync(params.ligand_ff, files[0])]
+
+    parametrised_files = await runTleapAsync(force_fields=force_fields, files=files, param_files=param_files, id=id,
+                                             *args, **kwargs)
+    if molecule_type == "cofactor":
+        parametrised_files = _alignCofactor(filename, parametrised_files, id)
+
+    return parametrised_files
+
+
+async def amberWrapperGatherAsync(params, entries, max_concurrent=None, **kwargs):
+    """
+    Parametrises many input files concurrently according to AMBER force field using amberWrapperAsync. The molecules
+    must have unique ids.
+
+    Parameters
+    ----------
+    params : ProtoCaller.Parametrise.Params
+        Force field parameters.
+    entries : [tuple]
+        Each tuple contains the positional arguments passed to amberWrapperAsync after params, i.e. (filename,
+        molecule_type[, id[, charge]]). A ValueError is raised if the resulting ids are not unique.
+    max_concurrent : int
+        Maximum number of molecules parametrised at the same time. Default: a third of the available CPUs.
+    kwargs
+        Keyword arguments to be passed to each amberWrapperAsync call.
+
+    Returns
+    -------
+    files : [[str]]
+        The output parametrised file(s) for each entry, in the same order as entries.
+    """
+    entries = list(entries)
+    _checkUniqueIds(entries, kwargs)
+    ncpus = _os.cpu_count() or 1
+    if max_concurrent is None:
+        max_concurrent = ncpus // 3
+    max_concurrent = max(1, max_concurrent)
+    # antechamber / sqm tend to run faster with fewer OpenMP threads
+    kwargs.setdefault("nthreads", max(1, ncpus // (3 * max_concurrent)))
+
+    semaphore = _asyncio.Semaphore(max_concurrent)
+
+    async def parametrise(entry):
+        async with semaphore:
+            return await amberWrapperAsync(params, *entry, **kwargs)
+
+    return await _asyncio.gather(*[parametrise(entry) for entry in entries])
+
+
+def amberWrapperGather(params, entries, max_concurrent=None, **kwargs):
+    """
+    A synchronous version of amberWrapperGatherAsync. This function starts its own event loop, so it cannot be called
+    from a running event loop (e.g. in Jupyter or in a coroutine), where amberWrapperGatherAsync should be awaited
+    instead.
+
+    Parameters
+    ----------
+    params : ProtoCaller.Parametrise.Params
+        Force field parameters.
+    entries : [tuple]
+        Each tuple contains the positional arguments passed to amberWrapperAsync after params, i.e. (filename,
+        molecule_type[, id[, charge]]). A ValueError is raised if the resulting ids are not unique.
+    max_concurrent : int
+        Maximum number of molecules parametrised at the same time. Default: a third of the available CPUs.
+    kwargs
+        Keyword arguments to be passed to each amberWrapperAsync call.
+
+    Returns
+    -------
+    files : [[str]]
+        The output parametrised file(s) for each entry, in the same order as entries.
+    """
+    return _asyncio.run(amberWrapperGatherAsync(params, entries, max_concurrent=max_concurrent, **kwargs))
+
+
+def amberWrapperBatch(params, entries, nprocs=None, **kwargs):
+    """
+    Parametrises many input files in parallel according to AMBER force field. Each parametrisation is run in a separate
+    process and a separate scratch directory so that the intermediate files of antechamber and tleap do not collide.
+    The molecules must have unique ids, since the output files are named after them.
+
+    Parameters
+    ----------
+    params : ProtoCaller.Parametrise.Params
+        Force field parameters.
+    entries : [tuple]
+        Each tuple contains the positional arguments passed to amberWrapper after params, i.e. (filename,
+        molecule_type[, id[, charge]]). A ValueError is raised if the resulting ids are not unique.
+    nprocs : int
+        Number of worker processes. Default: a third of the available CPUs.
+    kwargs
+        Keyword arguments to be passed to each amberWrapper call.
+
+    Returns
+    -------
+    files : [[str]]
+        The output parametrised file(s) for each entry, in the same order as entries.
+    """
+    ncpus = _os.cpu_count() or 1
+    if nprocs is None:
+        nprocs = ncpus // 3
+    nprocs = max(1, nprocs)
+    # antechamber / sqm tend to run faster with fewer OpenMP threads
+    nthreads = max(1, ncpus // (3 * nprocs))
+
+    entries = [(_os.path.abspath(entry[0]), *entry[1:]) for entry in entries]
+    _checkUniqueIds(entries, kwargs)
+    worker = _functools.partial(_amberWrapperScratch, params, _os.getcwd(), **kwargs)
+
+    with _futures.ProcessPoolExecutor(max_workers=nprocs, initializer=_setOMPThreads,
+                                      initargs=(nthreads,)) as executor:
+        return list(executor.map(worker, entries))
+
+
+def _setOMPThreads(nthreads):
+    _os.environ["OMP_NUM_THREADS"] = str(nthreads)
+
+
+def _amberWrapperScratch(params, workdir, entry, **kwargs):
+    # each worker runs in its own scratch directory and only moves the final files to the working directory
+    scratchdir = _tempfile.mkdtemp(prefix="amber_", dir=workdir)
+    try:
+        with _fileio.Dir(scratchdir):
+            files = amberWrapper(params, *entry, **kwargs)
+
+        if files is not None:
+            for i, file in enumerate(files):
+                if _os.path.dirname(file) == scratchdir:
+                    files[i] = _os.path.join(workdir, _os.path.basename(file))
+                    _shutil.move(file, files[i])
+    finally:
+        # the logs are kept in the working directory just like in the serial case, even if the run fails
+        for log_file in _os.scandir(scratchdir):
+            if log_file.name.split(".")[-1] in ["out", "err", "log"]:
+                with open(log_file.path) as log, open(_os.path.join(workdir, log_file.name), "a") as log_all:
+                    log_all.write(log.read())
+        _shutil.rmtree(scratchdir)
+
+    return files
+
+
+def _checkUniqueIds(entries, kwargs):
+    # all output files are named after the ids, so duplicate ids would overwrite each other
+    ids = _collections.Counter()
+    for entry in entries:
+        id = entry[2] if len(entry) > 2 else kwargs.get("id")
+        ids[entry[1] if id is None else id] += 1
+    duplicates = sorted(id for id, count in ids.items() if count > 1)
+    if duplicates:
+        raise ValueError("Each entry must have a unique id. Duplicate ids: {}".format(duplicates))
 
 
 def runAntechamber(force_field, file, output_ext="mol2", charge=None):
     """
-    A wrapper around antechamber.
+    A wrapper around antechamber. The outputs are cached in ProtoCaller.AMBERCACHEDIR based on the input file contents.
 
     Parameters
     ----------
@@ -122,6 +349,50 @@ def runAntechamber(force_field, file, output_ext="mol2", charge=None):
     output_name : str
         Absolute path of the output parametrised file.
     """
+    argv, output_name = _antechamberCommand(force_field, file, output_ext, charge)
+    cache_file = _cacheFile(argv)
+    if not _restoreFromCache(cache_file, output_name):
+        _runexternal.runExternal(argv, procname="antechamber")
+        _saveToCache(cache_file, output_name)
+
+    return output_name
+
+
+async def runAntechamberAsync(force_field, file, output_ext="mol2", charge=None, nthreads=None):
+    """
+    An asynchronous version of runAntechamber. Antechamber is run in a temporary directory so that concurrent runs do
+    not overwrite each other's intermediate files.
+
+    Parameters
+    ----------
+    force_field : str
+        Which force field to use. Only "gaff" and "gaff2" are accepted.
+    file : str
+        Name of input file.
+    output_ext : str
+        Output extension.
+    charge : int
+        The net charge of the molecule. Default: automatic detection by antechamber.
+    nthreads : int
+        Number of OpenMP threads used by antechamber. Default: inherited from the environment.
+
+    Returns
+    -------
+    output_name : str
+        Absolute path of the output parametrised file.
+    """
+    argv, output_name = _antechamberCommand(force_field, _os.path.abspath(file), output_ext, charge)
+    cache_file = _cacheFile(argv)
+    if not _restoreFromCache(cache_file, output_name):
+        env = None if nthreads is None else dict(_os.environ, OMP_NUM_THREADS=str(nthreads))
+        with _tempfile.TemporaryDirectory(dir=_os.getcwd()) as scratchdir:
+            await _runexternal.runExternalAsync(argv, procname="antechamber", cwd=scratchdir, env=env)
+        _saveToCache(cache_file, output_name)
+
+    return output_name
+
+
+def _antechamberCommand(force_field, file, output_ext, charge):
     input_base, input_ext = _os.path.splitext(file)[0], file.split(".")[-1]
     if input_ext.lower() in ["mol", "sdf"]:
         _babel.babelTransform(file, output_extension="mol2", pH=None)
@@ -129,19 +400,17 @@ def runAntechamber(force_field, file, output_ext="mol2", charge=None):
 
     output_name = "%s_antechamber.%s" % (input_base, output_ext)
 
-    commandstr = "antechamber -i '%s' -fi %s -o '%s' -fo %s -c bcc -at %s -s 2" % (
-        file, input_ext, output_name, output_ext, force_field)
+    argv = ["antechamber", "-i", file, "-fi", input_ext, "-o", output_name, "-fo", output_ext, "-c", "bcc",
+            "-at", force_field, "-s", "2"]
     if charge is not None:
-        commandstr += " -nc {}".format(charge)
+        argv += ["-nc", str(charge)]
 
-    _runexternal.runExternal(commandstr, procname="antechamber")
-
-    return _os.path.abspath(output_name)
+    return argv, _os.path.abspath(output_name)
 
 
 def runParmchk(force_field, file):
     """
-    A wrapper around parmchk2.
+    A wrapper around parmchk2. The outputs are cached in ProtoCaller.AMBERCACHEDIR based on the input file contents.
 
     Parameters
     ----------
@@ -155,11 +424,87 @@ def runParmchk(force_field, file):
     filename_output : str
         Absolute path to the extra parameter file generated by parmchk2.
     """
-    input_base, input_ext = _os.path.splitext(file)[0], file.split(".")[-1]
-    commandstr = "parmchk2 -i '{0}.{1}' -f {1} -o '{0}.frcmod' -s %s".format(input_base, input_ext, force_field)
-    _runexternal.runExternal(commandstr, procname="parmchk2")
+    argv, filename_output = _parmchkCommand(force_field, file)
+    cache_file = _cacheFile(argv)
+    if not _restoreFromCache(cache_file, filename_output):
+        _runexternal.runExternal(argv, procname="parmchk2")
+        _saveToCache(cache_file, filename_output)
 
-    return _os.path.abspath(input_base + ".frcmod")
+    return filename_output
+
+
+async def runParmchkAsync(force_field, file):
+    """
+    An asynchronous version of runParmchk.
+
+    Parameters
+    ----------
+    force_field : str
+        Which force field to use. Only "gaff" and "gaff2" are accepted.
+    file : str
+        Name of the file generated by antechamber.
+
+    Returns
+    -------
+    filename_output : str
+        Absolute path to the extra parameter file generated by parmchk2.
+    """
+    argv, filename_output = _parmchkCommand(force_field, file)
+    cache_file = _cacheFile(argv)
+    if not _restoreFromCache(cache_file, filename_output):
+        await _runexternal.runExternalAsync(argv, procname="parmchk2")
+        _saveToCache(cache_file, filename_output)
+
+    return filename_output
+
+
+def _parmchkCommand(force_field, file):
+    input_base, input_ext = _os.path.splitext(file)[0], file.split(".")[-1]
+    output_name = input_base + ".frcmod"
+    argv = ["parmchk2", "-i", file, "-f", input_ext, "-o", output_name, "-s", force_field]
+    return argv, _os.path.abspath(output_name)
+
+
+def _cacheFile(argv):
+    # identical input files with identical options always give identical outputs
+    if _PC.AMBERCACHEDIR is None:
+        return None
+    options = [arg for prev, arg in zip([None] + argv, argv) if prev not in ["-i", "-o"]]
+    key = _hashlib.blake2b("\0".join([_toolSignature(argv[0])] + options).encode())
+    with open(argv[argv.index("-i") + 1], "rb") as file:
+        key.update(file.read())
+    output_ext = argv[argv.index("-o") + 1].split(".")[-1]
+    return _os.path.join(_PC.AMBERCACHEDIR, argv[0], "%s.%s" % (key.hexdigest(), output_ext))
+
+
+@_functools.lru_cache(maxsize=None)
+def _toolSignature(name):
+    # a different or reinstalled executable may give different outputs for the same input
+    path = _shutil.which(name)
+    if path is None:
+        return ""
+    path = _os.path.realpath(path)
+    return "%s:%d" % (path, _os.stat(path).st_mtime_ns)
+
+
+def _restoreFromCache(cache_file, output_name):
+    if cache_file is None or not _os.path.exists(cache_file):
+        return False
+    _shutil.copyfile(cache_file, output_name)
+    return True
+
+
+def _saveToCache(cache_file, output_name):
+    if cache_file is None:
+        return
+    # the cache is only an optimisation, so we never fail because of it
+    try:
+        _os.makedirs(_os.path.dirname(cache_file), exist_ok=True)
+        temp_file = "%s.%d.tmp" % (cache_file, _os.getpid())
+        _shutil.copyfile(output_name, temp_file)
+        _os.replace(temp_file, cache_file)
+    except OSError:
+        pass
 
 
 def runTleap(force_fields=None, files=None, param_files=None, id=None, disulfide_bonds=None):
@@ -185,42 +530,76 @@ def runTleap(force_fields=None, files=None, param_files=None, id=None, disulfide
         Absolute paths of the final parametrised files. The first file is a topology file and the second file is a
         coordinate file.
     """
+    filename_tleap, filenames = _writeTleapScript(force_fields, files, param_files, id, disulfide_bonds)
+    _runexternal.runExternal(["tleap", "-f", filename_tleap], procname="tleap")
+    return [_os.path.abspath(f) for f in filenames]
+
+
+async def runTleapAsync(force_fields=None, files=None, param_files=None, id=None, disulfide_bonds=None):
+    """
+    An asynchronous version of runTleap.
+
+    Parameters
+    ----------
+    force_fields : [str]
+        All force fields to be loaded in tleap.
+    files : [str]
+        All regular files to be loaded in tleap.
+    param_files : [str]
+        All parameter files to be loaded in tleap.
+    id : str
+        The name of the molecule. Default: equal to molecule_type.
+    disulfide_bonds : [[ProtoCaller.IO.PDB.Residue, ProtoCaller.IO.PDB.Residue]]:
+        Residues between which there is a disulfide bond.
+
+    Returns
+    -------
+    filenames : [str]
+        Absolute paths of the final parametrised files. The first file is a topology file and the second file is a
+        coordinate file.
+    """
+    filename_tleap, filenames = _writeTleapScript(force_fields, files, param_files, id, disulfide_bonds)
+    await _runexternal.runExternalAsync(["tleap", "-f", filename_tleap], procname="tleap")
+    return [_os.path.abspath(f) for f in filenames]
+
+
+def _writeTleapScript(force_fields, files, param_files, id, disulfide_bonds):
     if id is None: id = "molecule"
     if disulfide_bonds is None: disulfide_bonds = []
 
     filename_tleap = "tleap_script_%s.in" % id
     filenames = [id + ".prmtop", id + ".inpcrd"]
 
-    with open(filename_tleap, "w+") as out:
-        for force_field in force_fields:
-            out.write("source \"%s\"\n" % returnFFPath(force_field))
-        if param_files is not None:
-            for param_file in param_files:
-                ext = param_file.split(".")[-1].lower()
-                if ext in ["frcmod", "frcfld"]:
-                    command = "loadamberparams"
-                elif ext in ["off", "lib"]:
-                    command = "loadoff"
-                elif ext == "prep":
-                    command = "loadamberprep"
-                else:
-                    _warnings.warn("%s is not a valid parameter file. Skipping value..." % param_file)
-                    continue
-                out.write("%s \"%s\"\n" % (command, param_file))
-        for file in files:
-            ext = file.split(".")[-1]
-            if ext == "pqr": ext = "pdb"
-            out.write("MOL = load%s \"%s\"\n" % (ext, file))
-        for disulfide_bond in disulfide_bonds:
-            out.write("bond MOL.%d.SG MOL.%d.SG\n" % (disulfide_bond[0].resSeq, disulfide_bond[1].resSeq))
-        # add support for cofactors
-        name = "MOL" if files else id
-        out.write("check {}\n".format(name))
-        out.write("saveAmberParm {0} {1} {2}\n".format(name, *filenames))
-        out.write("quit\n")
-
-    _runexternal.runExternal("tleap -f %s" % filename_tleap, procname="tleap")
-    return [_os.path.abspath(f) for f in filenames]
+    # the whole script is assembled in memory and written in one go
+    lines = ["source \"%s\"" % returnFFPath(force_field) for force_field in force_fields]
+    if param_files is not None:
+        for param_file in param_files:
+            ext = param_file.split(".")[-1].lower()
+            if ext in ["frcmod", "frcfld"]:
+                command = "loadamberparams"
+            elif ext in ["off", "lib"]:
+                command = "loadoff"
+            elif ext == "prep":
+                command = "loadamberprep"
+            else:
+                _warnings.warn("%s is not a valid parameter file. Skipping value..." % param_file)
+                continue
+            lines.append("%s \"%s\"" % (command, param_file))
+    for file in files:
+        ext = file.split(".")[-1]
+        if ext == "pqr": ext = "pdb"
+        lines.append("MOL = load%s \"%s\"" % (ext, file))
+    lines.extend("bond MOL.%d.SG MOL.%d.SG" % (bond[0].resSeq, bond[1].resSeq) for bond in disulfide_bonds)
+    # add support for cofactors
+    name = "MOL" if files else id
+    lines.append("check {}".format(name))
+    lines.append("saveAmberParm {0} {1} {2}".format(name, *filenames))
+    lines.append("quit")
+
+    with open(filename_tleap, "w") as out:
+        out.write("\n".join(lines) + "\n")
+
+    return filename_tleap, filenames
 
 
 def returnFFPath(name):
@@ -237,11 +616,4 @@ def returnFFPath(name):
     name : str
         Relative path to the force field file.
     """
-    if name in _PC.AMBEROLDFFS:
-        return "oldff/leaprc." + name
-    elif name in _PC.AMBERPROTEINFFS:
-        return "leaprc.protein.%s" % name
-    elif name in _PC.AMBERWATERFFS:
-        return "leaprc.water.%s" % name
-    else:
-        return "leaprc." + name
+    return _FF_PATHS.get(name, "leaprc." + name)
@@ -1,5 +1,8 @@
+import asyncio as _asyncio
 import logging as _logging
+import os as _os
 import re as _re
+import shlex as _shlex
 import subprocess as _subprocess
 import sys as _sys
 
@@ -11,25 +14,71 @@ def runExternal(*commands, procname=None, output_filebase=None):
     Parameters
     ----------
     commands
-        Positional arguments of type str. These are the shell commands to be executed.
+        Positional arguments of type str. These are the shell commands to be executed. Alternatively, a single list of
+        str can be passed, which is executed as an argument vector without spawning a shell.
     procname : str or None, optional
         The name of the process. None is the first word of the first executed command.
     output_filebase : str or None, optional
         The file base of the output logs. None is equal to the procname.
     """
-    try:
-        if(procname in ["", None]): procname = _re.search(r"([\w]*)\s", commands[0]).group(1)
-    except:
-        if(procname in ["", None]): procname = "UNDEFINED PROCESS"
+    procname = _defaultProcname(commands, procname)
     if(output_filebase is None): output_filebase = procname
 
     stdout = open("%s.out" % output_filebase, "a")
     stderr = open("%s.err" % output_filebase, "a")
     try:
         _logging.info("Running %s... " % procname)
-        _subprocess.check_call(commands, shell=True, stdout=stdout, stderr=stderr)
+        if len(commands) == 1 and not isinstance(commands[0], str):
+            _subprocess.check_call(list(commands[0]), stdout=stdout, stderr=stderr)
+        else:
+            _subprocess.check_call(commands, shell=True, stdout=stdout, stderr=stderr)
     except _subprocess.CalledProcessError:
         _logging.debug("Process failed with command(s) {}".format(commands))
         raise OSError("Error while calling command '%s'" % procname)
     stdout.close()
     stderr.close()
+
+
+async def runExternalAsync(*commands, procname=None, output_filebase=None, cwd=None, env=None):
+    """
+    An asynchronous counterpart of runExternal based on asyncio.create_subprocess_exec. The commands are executed
+    sequentially without spawning a shell.
+
+    Parameters
+    ----------
+    commands
+        Positional arguments of type str or list of str. These are the commands to be executed. Strings are split
+        using shell-like syntax and lists are used directly as argument vectors.
+    procname : str or None, optional
+        The name of the process. None is the first word of the first executed command.
+    output_filebase : str or None, optional
+        The file base of the output logs. None is equal to the procname.
+    cwd : str or None, optional
+        The working directory of the executed commands. None is the current working directory.
+    env : dict or None, optional
+        The environment variables of the executed commands. None is the environment of the current process.
+    """
+    procname = _defaultProcname(commands, procname)
+    if(output_filebase is None): output_filebase = procname
+
+    with open("%s.out" % output_filebase, "a") as stdout, open("%s.err" % output_filebase, "a") as stderr:
+        _logging.info("Running %s... " % procname)
+        for command in commands:
+            argv = _shlex.split(command) if isinstance(command, str) else command
+            proc = await _asyncio.create_subprocess_exec(*argv, stdout=stdout, stderr=stderr, cwd=cwd,
+                                                         env=env)
+            if await proc.wait():
+                _logging.debug("Process failed with command(s) {}".format(commands))
+                raise OSError("Error while calling command '%s'" % procname)
+
+
+def _defaultProcname(commands, procname):
+    try:
+        if(procname in ["", None]):
+            if isinstance(commands[0], str):
+                procname = _re.search(r"([\w]*)\s", commands[0]).group(1)
+            else:
+                procname = _os.path.basename(commands[0][0])
+    except:
+        if(procname in ["", None]): procname = "UNDEFINED PROCESS"
+    return procname
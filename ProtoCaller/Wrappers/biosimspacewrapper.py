@@ -3,16 +3,29 @@ if not _PC.BIOSIMSPACE:
     raise ImportError("BioSimSpace module cannot be imported")
 
 from collections.abc import Iterable as _Iterable
+import concurrent.futures as _futures
 import copy as _copy
+import functools as _functools
+import os as _os
 import re as _re
 import warnings as _warnings
+import weakref as _weakref
 
 import BioSimSpace as _BSS
+import numpy as _np
+import Sire.CAS as _SireCAS
 import Sire.MM as _SireMM
 import Sire.Maths as _SireMaths
 import Sire.Mol as _SireMol
 import Sire.Vol as _SireVol
 
+_INDEX_RE = _re.compile(r"Index\((\d+)\)")
+_BOND_RE = _re.compile(r"(\S+)\s*\[r - (\S+)\]")
+_BOND_R = _SireCAS.Expression(_SireCAS.Symbol("r"))
+
+# structural information which does not depend on the scale, keyed by the id of the Sire system
+_STRUCTURE_CACHE = {}
+
 
 def centre(system, box_length):
     """
@@ -42,19 +55,20 @@ def centre(system, box_length):
 
     box = system._getAABox()
     min_coords, max_coords = box.minCoords(), box.maxCoords()
-    centre = (min_coords + max_coords) / 2
+    min_coords = _np.asarray([min_coords.x(), min_coords.y(), min_coords.z()])
+    max_coords = _np.asarray([max_coords.x(), max_coords.y(), max_coords.z()])
     difference = max_coords - min_coords
 
-    box_length_new = []
-    for x, y in zip(difference, box_length):
-        box_length_new += [y] if x < 10 * y else [x / 10 + 1]
+    box_length = _np.asarray(box_length, dtype=float)
+    box_length_new = _np.where(difference < 10 * box_length, box_length, difference / 10 + 1)
     if cubic:
-        box_length_new = 3 * [max(box_length_new)]
-    if box_length_new != box_length:
+        box_length_new[:] = box_length_new.max()
+    if not _np.array_equal(box_length_new, box_length):
         _warnings.warn("Insufficient input box size. Changing to a box size of ({:.3f}, {:.3f}, {:.3f}) nm...".format(
             *box_length_new))
 
-    translation_vec = -centre + _SireMaths.Vector([5 * x for x in box_length_new])
+    translation_vec = _SireMaths.Vector(*(5 * box_length_new - (min_coords + max_coords) / 2).tolist())
+    box_length_new = box_length_new.tolist()
     system.translate(tuple(translation_vec))
     system = resize(system, box_length_new)
 
@@ -84,7 +98,7 @@ def resize(system, box_length):
     return system
 
 
-def rescaleSystemParams(system, scale, includelist=None, excludelist=None, neutralise=True):
+def rescaleSystemParams(system, scale, includelist=None, excludelist=None, neutralise=True, nthreads=1):
     """
     Rescales charge, Lennard-Jones and dihedral parameters for REST(2).
 
@@ -100,98 +114,143 @@ def rescaleSystemParams(system, scale, includelist=None, excludelist=None, neutr
         Molecule names to be excluded in the rescaling. Default: ["WAT"].
     neutralise : bool
         Whether to rescale a minimum number of Na+ or Cl- ions so that the rescaled part of the system is neutralised.
+    nthreads : int or None
+        Number of threads used to rescale the molecules. None means the number of available CPUs. Default: 1.
 
     Returns
     -------
     system_new : BioSimSpace.System
         The rescaled system.
+
+    Notes
+    -----
+    The choice of rescaled molecules and their available properties do not depend on the scale and are cached for as
+    long as the input system exists, so that rescaling the same system for many replicas is cheap. The cache entries
+    are keyed on the molecule numbers and versions, so any subsequent edits of the system are picked up.
     """
     if excludelist is None and includelist is None:
         excludelist = ["WAT"]
     elif excludelist is not None and includelist is not None:
         raise ValueError("Only one of includelist and excludelist can be set")
 
-    if neutralise:
-        if excludelist is not None:
-            total_charge = round(sum([mol.charge().magnitude() for mol in system.getMolecules()
-                                      if mol._sire_object.name().value() not in excludelist]))
-        elif includelist is not None:
-            total_charge = round(sum([mol.charge().magnitude() for mol in system.getMolecules()
-                                      if mol._sire_object.name().value() in includelist]))
+    mols = list(system.getMolecules())
+
+    # the choice of molecules does not depend on the scale, so we can reuse it for different replicas
+    cache = _structureCache(system)
+    mol_keys = [_moleculeKey(mol) for mol in mols]
+    cache_key = ("rescaled", None if includelist is None else frozenset(includelist),
+                 None if excludelist is None else frozenset(excludelist), neutralise, tuple(mol_keys))
+    if cache_key not in cache:
+        cache[cache_key] = _selectRescaledMolecules(mols, includelist, excludelist, neutralise)
+    rescaled, names = cache[cache_key]
+
+    props = []
+    for i in rescaled:
+        if ("props", mol_keys[i]) not in cache:
+            cache[("props", mol_keys[i])] = _rescaledProperties(mols[i]._sire_object)
+        props.append(cache[("props", mol_keys[i])])
+
+    mols_mod = list(mols)
+    rescaled_mols = _mapMolecules(_functools.partial(_rescaleMoleculeParams, scale=scale), nthreads,
+                                  [mols[i] for i in rescaled], names, props)
+    for i, mol in zip(rescaled, rescaled_mols):
+        mols_mod[i] = mol
+
+    system_new = _BSS._SireWrappers._system.System(mols_mod)
+    box = system._sire_object.property("space")
+    system_new._sire_object.setProperty("space", box)
+
+    return system_new
+
 
-    mols_mod = []
+def _selectRescaledMolecules(mols, includelist, excludelist, neutralise):
+    # we only traverse the molecules once and reuse their names below
+    names = [mol._sire_object.name().value() for mol in mols]
+    if excludelist is not None:
+        included = ~_np.isin(names, list(excludelist))
+    else:
+        included = _np.isin(names, list(includelist))
 
-    for mol in system.getMolecules():
-        if neutralise and mol._sire_object.name().value().lower() == "na" and total_charge < 0:
+    if neutralise:
+        total_charge = round(sum(mols[i].charge().magnitude() for i in _np.flatnonzero(included)))
+        ions = _np.char.lower(_np.asarray(names, dtype=str))
+        ions[~_np.isin(ions, ["na", "cl"])] = ""
+    else:
+        ions = _np.full(len(names), "")
+
+    # the neutralisation depends on the order of the molecules, so we select them before doing any editing
+    # molecules which are neither included nor ions (usually the bulk water) never enter this loop
+    rescaled = []
+    for i in _np.flatnonzero(included | (ions != "")):
+        if ions[i] == "na" and total_charge < 0:
             total_charge += 1
-        elif neutralise and mol._sire_object.name().value().lower() == "cl" and total_charge > 0:
+        elif ions[i] == "cl" and total_charge > 0:
             total_charge -= 1
-        elif excludelist is not None:
-            if mol._sire_object.name().value() in excludelist:
-                mols_mod += [mol]
-                continue
-        elif includelist is not None:
-            if mol._sire_object.name().value() not in includelist:
-                mols_mod += [mol]
-                continue
+        elif not included[i]:
+            continue
+        rescaled.append(i)
 
-        mol_edit = mol._sire_object.edit()
-
-        if scale != 1:
-            for prop in ["dihedral", "dihedral0", "dihedral1", "improper", "improper0", "improper1"]:
-                try:
-                    potentials = mol_edit.property(prop).potentials()
-                    prop_new = _SireMM.FourAtomFunctions(mol_edit.info())
-                    for potential in potentials:
-                        prop_new.set(potential.atom0(), potential.atom1(), potential.atom2(), potential.atom3(),
-                                     potential.function() * scale)
-                    mol_edit = mol_edit.setProperty(prop, prop_new).molecule()
-                except:
-                    continue
-
-        for atom in mol_edit.atoms():
-            idx = atom.index()
-
-            for prop in ["atomtype", "atomtype0", "atomtype1"]:
-                try:
-                    atomtype_new = atom.property(prop) + "_"
-                    mol_edit = mol_edit.atom(idx).setProperty(prop, atomtype_new).molecule()
-                except:
-                    continue
-
-            if scale != 1:
-                for prop in ["LJ", "LJ0", "LJ1"]:
-                    try:
-                        LJ = atom.property(prop)
-                        LJ = LJ.fromSigmaAndEpsilon(LJ.sigma(), LJ.epsilon() * scale)
-                        mol_edit = mol_edit.atom(idx).setProperty(prop, LJ).molecule()
-                    except:
-                        continue
-
-                for prop in ["charge", "charge0", "charge1"]:
-                    try:
-                        charge = atom.property(prop)
-                        charge = charge * scale
-                        mol_edit = mol_edit.atom(idx).setProperty(prop, charge).molecule()
-                    except:
-                        continue
-
-        if mol._sire_object.name().value().lower() in ["na", "cl"]:
-            resname = mol_edit.residue().name()
-            resname_new = _SireMol.ResName(resname.value() + "_")
-            mol_edit = mol_edit.residue(resname).rename(resname_new)
-
-        mol._sire_object = mol_edit.commit()
-        mols_mod += [mol]
+    return rescaled, [names[i] for i in rescaled]
 
-    system_new = _BSS._SireWrappers._system.System(mols_mod)
-    box = system._sire_object.property("space")
-    system_new._sire_object.setProperty("space", box)
 
-    return system_new
+def _rescaledProperties(mol):
+    # we only probe the available properties once per molecule rather than once per atom
+    return {key: [prop for prop in value if mol.hasProperty(prop)] for key, value in {
+        "dihedral": ["dihedral", "dihedral0", "dihedral1", "improper", "improper0", "improper1"],
+        "atomtype": ["atomtype", "atomtype0", "atomtype1"],
+        "LJ": ["LJ", "LJ0", "LJ1"],
+        "charge": ["charge", "charge0", "charge1"],
+    }.items()}
+
+
+def _rescaleMoleculeParams(mol, name, props, scale):
+    mol_edit = mol._sire_object.edit()
+
+    if scale != 1:
+        for prop in props["dihedral"]:
+            potentials = mol_edit.property(prop).potentials()
+            prop_new = _SireMM.FourAtomFunctions(mol_edit.info())
+            for potential in potentials:
+                prop_new.set(potential.atom0(), potential.atom1(), potential.atom2(), potential.atom3(),
+                             potential.function() * scale)
+            mol_edit = mol_edit.setProperty(prop, prop_new).molecule()
+
+    atomtype_props = props["atomtype"]
+    if scale != 1:
+        LJ_props, charge_props = props["LJ"], props["charge"]
+    else:
+        LJ_props, charge_props = [], []
+
+    # all properties of an atom are set on a single atom editor so that the molecule is only updated once per atom
+    for atom in mol_edit.atoms():
+        atom_edit = mol_edit.atom(atom.index())
+
+        for prop in atomtype_props:
+            atomtype_new = atom.property(prop) + "_"
+            atom_edit = atom_edit.setProperty(prop, atomtype_new)
+
+        for prop in LJ_props:
+            LJ = atom.property(prop)
+            LJ = LJ.fromSigmaAndEpsilon(LJ.sigma(), LJ.epsilon() * scale)
+            atom_edit = atom_edit.setProperty(prop, LJ)
+
+        for prop in charge_props:
+            charge = atom.property(prop)
+            charge = charge * scale
+            atom_edit = atom_edit.setProperty(prop, charge)
+
+        mol_edit = atom_edit.molecule()
 
+    if name.lower() in ["na", "cl"]:
+        resname = mol_edit.residue().name()
+        resname_new = _SireMol.ResName(resname.value() + "_")
+        mol_edit = mol_edit.residue(resname).rename(resname_new)
 
-def rescaleBondedDummies(system, scale, bonds=None):
+    mol._sire_object = mol_edit.commit()
+    return mol
+
+
+def rescaleBondedDummies(system, scale, bonds=None, nthreads=1):
     """
     Rescales bonds which are connected to the dummy atoms
 
@@ -208,74 +267,134 @@ def rescaleBondedDummies(system, scale, bonds=None):
         contain the name of the molecule, and the values are lists of tuples
         which contain the bond indices to be rescaled. Default: all dummy bonds
         in the system are rescaled.
+    nthreads : int or None
+        Number of threads used to rescale the molecules. None means the number
+        of available CPUs. Default: 1.
 
     Returns
     -------
     system_new : BioSimSpace.System
         The rescaled system.
+
+    Notes
+    -----
+    The dummy atoms of each molecule do not depend on the scale and are cached
+    for as long as the input system exists. The cache entries are keyed on the
+    molecule numbers and versions, so any subsequent edits of the system are
+    picked up.
     """
     if scale == 1:
         return system
 
-    mols_mod = []
+    mols_mod = list(system.getMolecules())
+    rescaled, rescaled_bonds = [], []
 
-    for mol in system.getMolecules():
+    for i, mol in enumerate(mols_mod):
         mol_name = mol._sire_object.name().value()
-        if bonds is not None and (mol_name not in bonds.keys() or not bonds[mol_name]):
-            mols_mod += [mol]
-            continue
         if bonds is None:
-            bonds_to_incl = None
+            rescaled_bonds.append(None)
+        elif mol_name in bonds.keys() and bonds[mol_name]:
+            rescaled_bonds.append({frozenset(x) for x in bonds[mol_name]})
         else:
-            bonds_to_incl = {frozenset(x) for x in bonds[mol_name]}
+            continue
+        rescaled.append(i)
+
+    # the dummy atoms do not depend on the scale, so we can reuse them for different scales
+    cache = _structureCache(system)
+    dummies = []
+    for i in rescaled:
+        key = ("dummies", _moleculeKey(mols_mod[i]))
+        if key not in cache:
+            cache[key] = _dummyAtoms(mols_mod[i]._sire_object)
+        dummies.append(cache[key])
+
+    rescaled_mols = _mapMolecules(_functools.partial(_rescaleMoleculeDummyBonds, scale=scale), nthreads,
+                                  [mols_mod[i] for i in rescaled], rescaled_bonds, dummies)
+    for i, mol in zip(rescaled, rescaled_mols):
+        mols_mod[i] = mol
 
-        mol_edit = mol._sire_object.edit()
+    system_new = _BSS._SireWrappers._system.System(mols_mod)
+    box = system._sire_object.property("space")
+    system_new._sire_object.setProperty("space", box)
 
-        dummies0 = []
-        dummies1 = []
+    return system_new
 
-        for atom in mol_edit.atoms():
-            pat = r"AtomIdx\((\d*)\)"
-            if "dummy" in atom.property("element0").toString():
-                dummies0 += [int(*_re.search(pat, atom.index().toString()).groups())]
-            elif "dummy" in atom.property("element1").toString():
-                dummies1 += [int(*_re.search(pat, atom.index().toString()).groups())]
 
-        for prop, dummies in zip(["bond0", "bond1"], [dummies0, dummies1]):
-            potentials = mol_edit.property(prop).potentials()
-            prop_new = _copy.copy(mol_edit.property(prop))
-            for potential in potentials:
-                pat = r"Index\((\d*)\)"
-                at0_idx = int(*_re.search(pat, potential.atom0().toString()).groups())
-                at1_idx = int(*_re.search(pat, potential.atom1().toString()).groups())
-                bond_key = {at0_idx, at1_idx}
-
-                # we ignore bonds that are not specified by the user
-                if bonds_to_incl is not None and bond_key not in bonds_to_incl:
-                    continue
-
-                # we ignore non-dummy bonds
-                if not at0_idx in dummies and not at1_idx in dummies:
-                    continue
-
-                func = potential.function()
-                func_str = func.toString()
-                pat = r"(\S*)\s*\[r - (\S*)\]"
-                k, r_eq = [float(x) for x in _re.match(pat, func_str).groups()]
-
-                # here we scale the r_eq
-                # this is a bit of a hack since it is difficult to instantiate
-                # Sire CAS from python
-                func = k * ((func / k).root(2) + (1 - scale) * r_eq).squared()
-
-                prop_new.set(potential.atom0(), potential.atom1(), func)
-            mol_edit = mol_edit.setProperty(prop, prop_new).molecule()
+def _dummyAtoms(mol):
+    dummies0 = set()
+    dummies1 = set()
 
-        mol._sire_object = mol_edit.commit()
-        mols_mod += [mol]
+    # dummy atoms have no protons, so we can avoid any string comparisons
+    for atom in mol.atoms():
+        if not atom.property("element0").nProtons():
+            dummies0.add(atom.index().value())
+        elif not atom.property("element1").nProtons():
+            dummies1.add(atom.index().value())
 
-    system_new = _BSS._SireWrappers._system.System(mols_mod)
-    box = system._sire_object.property("space")
-    system_new._sire_object.setProperty("space", box)
+    return dummies0, dummies1
 
-    return system_new
+
+def _rescaleMoleculeDummyBonds(mol, bonds_to_incl, dummies_all, scale):
+    mol_edit = mol._sire_object.edit()
+
+    for prop, dummies in zip(["bond0", "bond1"], dummies_all):
+        potentials = mol_edit.property(prop).potentials()
+        prop_new = _copy.copy(mol_edit.property(prop))
+
+        # we extract all atoms from the potentials in one go before any filtering
+        atoms0 = [potential.atom0() for potential in potentials]
+        atoms1 = [potential.atom1() for potential in potentials]
+        indices0 = [int(_INDEX_RE.search(atom.toString()).group(1)) for atom in atoms0]
+        indices1 = [int(_INDEX_RE.search(atom.toString()).group(1)) for atom in atoms1]
+
+        for potential, atom0, atom1, at0_idx, at1_idx in zip(potentials, atoms0, atoms1, indices0, indices1):
+            bond_key = {at0_idx, at1_idx}
+
+            # we ignore bonds that are not specified by the user
+            if bonds_to_incl is not None and bond_key not in bonds_to_incl:
+                continue
+
+            # we ignore non-dummy bonds
+            if not at0_idx in dummies and not at1_idx in dummies:
+                continue
+
+            func_str = potential.function().toString()
+            k, r_eq = [float(x) for x in _BOND_RE.match(func_str).groups()]
+
+            # here we build the harmonic bond with a scaled r_eq directly
+            func = k * (_BOND_R - scale * r_eq).squared()
+
+            prop_new.set(atom0, atom1, func)
+        mol_edit = mol_edit.setProperty(prop, prop_new).molecule()
+
+    mol._sire_object = mol_edit.commit()
+    return mol
+
+
+def _mapMolecules(func, nthreads, *iterables):
+    # the molecules are edited independently of each other, so they can be processed in parallel
+    if nthreads is None:
+        nthreads = _os.cpu_count() or 1
+    if nthreads == 1:
+        return list(map(func, *iterables))
+    with _futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+        return list(executor.map(func, *iterables))
+
+
+def _moleculeKey(mol):
+    # every edit of a molecule increments its version, so stale entries are never looked up
+    return mol._sire_object.number().value(), mol._sire_object.version()
+
+
+def _structureCache(system):
+    # the cache is tied to the lifetime of the Sire system, so that ids of deleted systems are never reused
+    sire_system = system._sire_object
+    key = id(sire_system)
+    entry = _STRUCTURE_CACHE.get(key)
+    if entry is None or entry[0]() is not sire_system:
+        try:
+            ref = _weakref.ref(sire_system, lambda _, key=key: _STRUCTURE_CACHE.pop(key, None))
+        except TypeError:
+            return {}
+        entry = _STRUCTURE_CACHE[key] = (ref, {})
+    return entry[1]
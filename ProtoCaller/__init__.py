@@ -103,6 +103,10 @@ PROTEINFFS = AMBERPROTEINFFS
 LIGANDFFS = AMBERLIGANDFFS
 WATERFFS = AMBERWATERFFS
 
+# on-disk cache of antechamber and parmchk2 outputs, keyed by the input file contents. None disables the cache
+AMBERCACHEDIR = _os.path.join(_os.environ.get("XDG_CACHE_HOME") or _os.path.expanduser("~/.cache"), "protocaller",
+                              "amber")
+
 HEADLESS_CHARMMGUI = True
 
 try:
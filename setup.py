@@ -1,5 +1,19 @@
+import glob
+
 from setuptools import find_packages, setup
 
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# compiled accelerators are optional: Cython sources are only built if Cython is available
+pyx_files = glob.glob("ProtoCaller/**/*.pyx", recursive=True)
+if cythonize is not None and pyx_files:
+    ext_modules = cythonize(pyx_files, compiler_directives={'language_level': 3})
+else:
+    ext_modules = []
+
 
 setup(
     name='ProtoCaller',
@@ -12,6 +26,7 @@ setup(
     url='https://github.com/kyllend/protocaller',
     license='MIT',
     packages=find_packages(),
+    ext_modules=ext_modules,
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
@@ -24,6 +39,21 @@ setup(
         'similarity',
         'RDKit'
     ],
+    python_requires='>=3.7',
+    # AmberTools, BioSimSpace, OpenBabel, PDBFixer, RDKit and Sire are installed through conda (see conda-recipe)
+    install_requires=[
+        'biopython',
+        'mdanalysis',
+        'numpy',
+        'parmed',
+        'pdb2pqr',  # not imported, but provides the pdb2pqr30 executable
+        'pymbar',
+        'requests',
+        'scipy',
+        'selenium',
+        'selenium-requests',
+    ],
     include_package_data=True,
-    package_data={'': ['QM_137k.pt']},
+    package_data={'ProtoCaller': ['shared/amber-parameters/cofactors/*']},
+    zip_safe=False,
 )
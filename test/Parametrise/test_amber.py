@@ -0,0 +1,98 @@
+import os
+import sys
+import types
+
+import pytest
+
+import ProtoCaller as PC
+import ProtoCaller.Parametrise.amber as amber
+from ProtoCaller.Parametrise.amber import amberWrapperBatch, returnFFPath
+
+
+def test_returnFFPath():
+    assert returnFFPath("ff14SB") == "leaprc.protein.ff14SB"
+    assert returnFFPath("ff99SB") == "oldff/leaprc.ff99SB"
+    assert returnFFPath("tip3p") == "leaprc.water.tip3p"
+    assert returnFFPath("gaff2") == "leaprc.gaff2"
+
+
+def test_cacheFile(tmp_path, monkeypatch):
+    monkeypatch.setattr(PC, "AMBERCACHEDIR", str(tmp_path / "cache"))
+    input_file = tmp_path / "ligand.mol2"
+    input_file.write_text("@<TRIPOS>MOLECULE\nligand\n")
+    output_file = tmp_path / "ligand_antechamber.mol2"
+    output_file.write_text("parametrised\n")
+
+    def command(charge):
+        return ["antechamber", "-i", str(input_file), "-fi", "mol2", "-o", str(output_file), "-fo", "mol2",
+                "-c", "bcc", "-at", "gaff2", "-s", "2", "-nc", str(charge)]
+
+    cache_file = amber._cacheFile(command(0))
+    assert not amber._restoreFromCache(cache_file, str(output_file))
+    amber._saveToCache(cache_file, str(output_file))
+
+    # same input and options
+    restored_file = tmp_path / "restored.mol2"
+    assert amber._cacheFile(command(0)) == cache_file
+    assert amber._restoreFromCache(amber._cacheFile(command(0)), str(restored_file))
+    assert restored_file.read_text() == "parametrised\n"
+
+    # different net charge
+    assert amber._cacheFile(command(1)) != cache_file
+    assert not amber._restoreFromCache(amber._cacheFile(command(1)), str(restored_file))
+
+    # different input file contents
+    input_file.write_text("@<TRIPOS>MOLECULE\nligand2\n")
+    assert amber._cacheFile(command(0)) != cache_file
+    input_file.write_text("@<TRIPOS>MOLECULE\nligand\n")
+
+    # different antechamber executable
+    monkeypatch.setattr(amber, "_toolSignature", lambda name: "/other/bin/antechamber:0")
+    assert amber._cacheFile(command(0)) != cache_file
+
+    # disabled cache
+    monkeypatch.setattr(PC, "AMBERCACHEDIR", None)
+    assert amber._cacheFile(command(0)) is None
+    assert not amber._restoreFromCache(None, str(restored_file))
+    amber._saveToCache(None, str(output_file))
+
+
+def test_amberWrapperBatch(tmp_path, monkeypatch):
+    # a stub tleap which writes the OpenMP thread count into the output files
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    tleap = bindir / "tleap"
+    tleap.write_text(
+        "#!%s\n" % sys.executable +
+        "import os, sys\n"
+        "lines = open(sys.argv[sys.argv.index('-f') + 1]).read().splitlines()\n"
+        "prmtop, inpcrd = [line.split() for line in lines if line.startswith('saveAmberParm')][0][2:]\n"
+        "for filename in [prmtop, inpcrd]:\n"
+        "    open(filename, 'w').write(os.environ.get('OMP_NUM_THREADS', '') + '\\n')\n"
+        "open('leap.log', 'a').write('leap ' + prmtop + '\\n')\n"
+        "print('tleap ' + prmtop)\n"
+    )
+    tleap.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bindir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setattr(os, "cpu_count", lambda: 12)
+
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    for name in ["water1.pdb", "water2.pdb"]:
+        (workdir / name).write_text("")
+    params = types.SimpleNamespace(water_ff="tip3p")
+
+    files = amberWrapperBatch(params, [("water1.pdb", "water", "WAT1"), ("water2.pdb", "water", "WAT2")], nprocs=2)
+    assert files == [[str(workdir / "WAT1.prmtop"), str(workdir / "WAT1.inpcrd")],
+                     [str(workdir / "WAT2.prmtop"), str(workdir / "WAT2.inpcrd")]]
+    # 12 CPUs / (3 * 2 processes)
+    assert all(open(file).read() == "2\n" for file in sum(files, []))
+
+    # the scratch directories are removed and the logs of both runs are kept
+    assert not [name for name in os.listdir(workdir) if name.startswith("amber_")]
+    assert sorted(open("tleap.out").read().splitlines()) == ["tleap WAT1.prmtop", "tleap WAT2.prmtop"]
+    assert sorted(open("leap.log").read().splitlines()) == ["leap WAT1.prmtop", "leap WAT2.prmtop"]
+
+    with pytest.raises(ValueError):
+        amberWrapperBatch(params, [("water1.pdb", "water"), ("water2.pdb", "water")])
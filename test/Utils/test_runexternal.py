@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+import pytest
+
+from ProtoCaller.Utils.runexternal import runExternal, runExternalAsync
+
+
+def test_runExternal_argv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    # the arguments are never interpreted by a shell
+    argument = "a  'b' \"c\"; touch injected"
+    runExternal(["echo", argument])
+    assert open("echo.out").read() == argument + "\n"
+    assert not os.path.exists("injected")
+
+    # the logs are appended
+    runExternal(["echo", "second"])
+    assert open("echo.out").read() == argument + "\nsecond\n"
+    assert os.path.exists("echo.err")
+
+    with pytest.raises(OSError):
+        runExternal(["false"])
+
+
+def test_runExternalAsync(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    # strings are split using shell-like syntax, but are never interpreted by a shell
+    asyncio.run(runExternalAsync("echo 'a  b' c; touch injected"))
+    assert open("echo.out").read() == "a  b c; touch injected\n"
+    assert not os.path.exists("injected")
+
+    # argument vectors are used as they are and the logs are appended
+    asyncio.run(runExternalAsync(["echo", "a  'b' \"c\""], "echo second"))
+    assert open("echo.out").read() == "a  b c; touch injected\na  'b' \"c\"\nsecond\n"
+
+    # the output file base, working directory and environment
+    os.mkdir("subdir")
+    asyncio.run(runExternalAsync(["sh", "-c", "echo $VALUE; pwd"], output_filebase="env", cwd="subdir",
+                                 env=dict(os.environ, VALUE="value")))
+    assert open("env.out").read() == "value\n%s\n" % os.path.realpath("subdir")
+    assert os.path.exists("env.err")
+
+    with pytest.raises(OSError):
+        asyncio.run(runExternalAsync(["false"]))
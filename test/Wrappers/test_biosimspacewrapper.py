@@ -0,0 +1,76 @@
+import pytest
+
+from ProtoCaller.Wrappers.biosimspacewrapper import _selectRescaledMolecules
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def magnitude(self):
+        return self._value
+
+
+class _SireMolecule:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return _Value(self._name)
+
+
+class _Molecule:
+    def __init__(self, name, charge):
+        self._sire_object = _SireMolecule(name)
+        self._charge = charge
+
+    def charge(self):
+        return _Value(self._charge)
+
+
+def _selectRescaledMoleculesReference(mols, includelist, excludelist, neutralise):
+    # the original single loop over all molecules
+    names = [mol._sire_object.name().value() for mol in mols]
+    total_charge = round(sum(mol.charge().magnitude() for mol, name in zip(mols, names)
+                             if (excludelist is None or name not in excludelist) and
+                             (includelist is None or name in includelist)))
+    rescaled = []
+    for i, name in enumerate(names):
+        if neutralise and name.lower() == "na" and total_charge < 0:
+            total_charge += 1
+        elif neutralise and name.lower() == "cl" and total_charge > 0:
+            total_charge -= 1
+        elif excludelist is not None and name in excludelist:
+            continue
+        elif includelist is not None and name not in includelist:
+            continue
+        rescaled.append(i)
+    return rescaled
+
+
+def _system(charge, ions_first):
+    solute = [_Molecule("LIG", charge), _Molecule("PROT", 0.0)]
+    solvent = [_Molecule("WAT", 0.0) for _ in range(3)]
+    ions = [_Molecule("Na", 1.0), _Molecule("CL", -1.0), _Molecule("Na", 1.0), _Molecule("CL", -1.0),
+            _Molecule("NA", 1.0), _Molecule("Cl", -1.0)]
+    return ions + solute + solvent if ions_first else solute + solvent + ions
+
+
+@pytest.mark.parametrize("charge", [-2.0, 2.0, 0.0, -0.4])
+@pytest.mark.parametrize("ions_first", [False, True])
+@pytest.mark.parametrize("neutralise", [True, False])
+@pytest.mark.parametrize("includelist, excludelist", [
+    (None, ["WAT"]),
+    (None, {"WAT", "PROT"}),
+    (["LIG"], None),
+    ({"LIG", "PROT"}, None),
+])
+def test_selectRescaledMolecules(charge, ions_first, neutralise, includelist, excludelist):
+    mols = _system(charge, ions_first)
+    rescaled, names = _selectRescaledMolecules(mols, includelist, excludelist, neutralise)
+    reference = _selectRescaledMoleculesReference(mols, includelist, excludelist, neutralise)
+    assert [int(i) for i in rescaled] == reference
+    assert names == [mols[i]._sire_object.name().value() for i in reference]